@@ -4,6 +4,7 @@ RDW API client functions.
 Handles HTTP session management, API requests, and retry logic.
 """
 
+import functools
 import io
 import os
 import time
@@ -13,42 +14,55 @@ from typing import BinaryIO
 import polars as pl
 import requests
 
-from config import API_BASE, REQUEST_TIMEOUT
+from config import API_BASE, DEFAULT_PARALLEL_WORKERS, DOWNLOAD_CHUNK_SIZE, REQUEST_TIMEOUT
 
 # URL templates
 COUNT_URL = API_BASE + "/resource/{id}.json?$select=count(*)"
 CSV_URL = API_BASE + "/resource/{id}.csv"
 
-# Dynamic worker scaling for parallel downloads.
-PARALLEL_WORKERS = int(
-    os.environ.get(
-        "RDW_WORKERS",
-        min(32, (os.cpu_count() or 1) + 4),
-    )
-)
-
 
+@functools.cache
 def env_load() -> None:
-    """Load environment variables from .env file."""
+    """Load environment variables from .env file.
+
+    Cached, so repeated calls within one process are no-ops.
+    """
     env_path = Path(__file__).parent.parent / ".env"
-    if env_path.exists():
-        with open(env_path) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#") and "=" in line:
-                    k, v = line.split("=", 1)
-                    if k.strip() not in os.environ:
-                        os.environ[k.strip()] = v.strip().strip("\"'")
-
-
-def session_create() -> requests.Session:
-    """Create HTTP session with connection pooling optimized for parallel downloads."""
+    if not env_path.exists():
+        return
+    lines = (line.strip() for line in env_path.read_text().splitlines())
+    pairs = (
+        line.split("=", 1) for line in lines if line and not line.startswith("#") and "=" in line
+    )
+    os.environ.update(
+        {k.strip(): v.strip().strip("\"'") for k, v in pairs if k.strip() not in os.environ}
+    )
+
+
+def parallel_workers_get() -> int:
+    """Return concurrent RDW requests across all datasets, read at call time.
+
+    RDW_MAX_PARALLEL wins, RDW_WORKERS is still honoured, else a fixed
+    server-friendly default (not scaled by local CPU count).
+    """
+    value = os.environ.get("RDW_MAX_PARALLEL") or os.environ.get("RDW_WORKERS")
+    return max(1, int(value)) if value else DEFAULT_PARALLEL_WORKERS
+
+
+def session_create(pool_size: int) -> requests.Session:
+    """Create HTTP session with connection pooling optimized for parallel downloads.
+
+    pool_size should cover every thread sharing the session across datasets.
+    """
     session = requests.Session()
     adapter = requests.adapters.HTTPAdapter(
-        pool_connections=PARALLEL_WORKERS,
-        pool_maxsize=PARALLEL_WORKERS,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
         max_retries=requests.adapters.Retry(
-            total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504]
+            total=3,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
         ),
     )
     session.mount("https://", adapter)
@@ -89,9 +103,15 @@ def csv_stream_download(
     where_clause: str | None,
     row_limit: int,
     output: BinaryIO,
+    columns: list[str] | None = None,
 ) -> None:
-    """Stream a CSV export from RDW to a writable binary stream."""
+    """Stream a CSV export from RDW to a writable binary stream.
+
+    When columns is given, the export is projected server-side with $select.
+    """
     params = {"$limit": str(row_limit)}
+    if columns:
+        params["$select"] = ",".join(columns)
     if where_clause:
         params["$where"] = where_clause
     max_retries = 5
@@ -108,7 +128,7 @@ def csv_stream_download(
                 timeout=REQUEST_TIMEOUT,
             ) as response:
                 response.raise_for_status()
-                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                     if chunk:
                         output.write(chunk)
             return
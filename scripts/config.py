@@ -23,8 +23,9 @@ THRESHOLD_MODEL_RANKING = 100
 
 # === Download Settings ===
 REQUEST_TIMEOUT = 3600  # 1 hour for very large downloads
-PAGE_SIZE = 50000  # Rows per page for parallel pagination
-DOWNLOAD_BATCH_PAGES = 4  # RDW pages per temporary Parquet batch
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MiB streamed response chunks
+PARQUET_ROW_GROUP_SIZE = 100_000  # Rows per Parquet row group (bounds writer memory)
+DEFAULT_PARALLEL_WORKERS = 8  # Concurrent RDW requests across all datasets
 
 # === RDW API Configuration ===
 API_BASE = "https://opendata.rdw.nl"
@@ -38,18 +39,47 @@ DATASETS = {
     "8ys7-d773": "brandstof",
 }
 
+# Dataset ID -> RDW columns read by Stage 2. Stage 1 projects CSV exports to these
+# columns with $select, so unused fields never cross the wire.
+DATASET_COLUMNS = {
+    "m9d7-ebf2": [
+        "kenteken",
+        "voertuigsoort",
+        "merk",
+        "handelsbenaming",
+        "datum_eerste_toelating",
+        "catalogusprijs",
+    ],
+    "sgfe-77wx": [
+        "kenteken",
+        "meld_datum_door_keuringsinstantie",
+        "meld_tijd_door_keuringsinstantie",
+        "soort_melding_ki_omschrijving",
+    ],
+    "a34c-vvps": [
+        "kenteken",
+        "meld_datum_door_keuringsinstantie",
+        "meld_tijd_door_keuringsinstantie",
+        "gebrek_identificatie",
+        "aantal_gebreken_geconstateerd",
+    ],
+    "hx2c-gt7k": ["gebrek_identificatie", "gebrek_omschrijving"],
+    "8ys7-d773": ["kenteken", "brandstof_omschrijving"],
+}
+
 # === Processing Configuration ===
 KNOWN_FUEL_TYPES = {"Benzine", "Diesel", "Elektriciteit", "LPG"}
 VEHICLE_TYPE_CONSUMER = "consumer"
 VEHICLE_TYPE_COMMERCIAL = "commercial"
 
 # === Cache Validation ===
-# Minimum file sizes in bytes for cache validation
+# Minimum file sizes in bytes for cache validation. Conservative lower bounds for
+# the column-projected downloads (see DATASET_COLUMNS).
 MIN_CACHE_SIZES = {
-    "voertuigen": 500_000_000,  # ~500 MB
-    "meldingen": 250_000_000,  # ~250 MB
-    "geconstateerde_gebreken": 100_000_000,  # ~100 MB
-    "gebreken": 10_000,  # ~10 KB (small reference table)
-    "brandstof": 50_000_000,  # ~50 MB
+    "voertuigen": 50_000_000,  # ~50 MB
+    "meldingen": 100_000_000,  # ~100 MB
+    "geconstateerde_gebreken": 50_000_000,  # ~50 MB
+    "gebreken": 5_000,  # ~5 KB (small reference table)
+    "brandstof": 25_000_000,  # ~25 MB
 }
-DEFAULT_MIN_CACHE_SIZE = 10_000  # 10 KB fallback
+DEFAULT_MIN_CACHE_SIZE = 5_000  # 5 KB fallback
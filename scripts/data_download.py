@@ -20,7 +20,7 @@ Datasets:
 
 import argparse
 import io
-import json
+import os
 import shutil
 import sys
 import tempfile
@@ -30,56 +30,69 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
+import orjson
 import polars as pl
 import requests
 
 from api_client import (
-    PARALLEL_WORKERS,
     csv_stream_download,
     env_load,
+    parallel_workers_get,
     row_count_get,
     session_create,
 )
-from config import DATASETS, DIR_PARQUET
+from config import DATASET_COLUMNS, DATASETS, DIR_PARQUET, PARQUET_ROW_GROUP_SIZE
 from system_utils import memory_mb, path_size_mb
 
 # Metadata file path
 METADATA_FILE = DIR_PARQUET / ".download_metadata.json"
 KENTEKEN_DATASETS = {"m9d7-ebf2", "sgfe-77wx", "a34c-vvps", "8ys7-d773"}
 KENTEKEN_PREFIXES = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-SHARD_WORKERS = PARALLEL_WORKERS
 
 
 def metadata_load() -> dict:
     """Load download metadata from disk."""
     if METADATA_FILE.exists():
-        with open(METADATA_FILE) as f:
-            return json.load(f)
+        return orjson.loads(METADATA_FILE.read_bytes())
     return {}
 
 
 def metadata_save(metadata: dict) -> None:
-    """Save download metadata to disk."""
+    """Save download metadata to disk atomically via a temp file and rename."""
     DIR_PARQUET.mkdir(parents=True, exist_ok=True)
-    with open(METADATA_FILE, "w") as f:
-        json.dump(metadata, f, indent=2)
+    with tempfile.NamedTemporaryFile(
+        dir=DIR_PARQUET, prefix=f"{METADATA_FILE.name}.", delete=False
+    ) as temp_file:
+        temp_path = Path(temp_file.name)
+    try:
+        temp_path.write_bytes(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+        os.replace(temp_path, METADATA_FILE)
+    finally:
+        # No-op after a successful replace; removes the leftover on any failure
+        temp_path.unlink(missing_ok=True)
 
 
-def last_download_date_set(dataset_id: str, date_str: str) -> None:
-    """Set last download date for a dataset."""
-    metadata = metadata_load()
-    if dataset_id not in metadata:
-        metadata[dataset_id] = {}
-    metadata[dataset_id]["last_date"] = date_str
-    metadata[dataset_id]["updated_at"] = datetime.now().isoformat()
-    metadata_save(metadata)
+def last_download_date_set(metadata: dict, dataset_id: str, date_str: str) -> None:
+    """Set last download date for a dataset in the in-memory metadata."""
+    entry = metadata.setdefault(dataset_id, {})
+    entry["last_date"] = date_str
+    entry["updated_at"] = datetime.now().isoformat()
+
+
+def dir_fsync(path: Path) -> None:
+    """Flush a directory entry so a preceding rename survives a crash."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 def temp_schema_collect(temp_paths: list[Path]) -> dict[str, pl.DataType]:
-    """Collect the union schema from temporary Parquet files."""
+    """Collect the union schema from temporary Parquet file footers."""
     schema: dict[str, pl.DataType] = {}
     for temp_path in temp_paths:
-        for name, dtype in pl.scan_parquet(temp_path).collect_schema().items():
+        for name, dtype in pl.read_parquet_schema(temp_path).items():
             schema.setdefault(name, dtype)
     return schema
 
@@ -100,12 +113,16 @@ def dataset_download_sharded(
     output_path: Path,
     verbose: bool,
     total_rows: int,
+    workers: int,
+    request_slots: threading.BoundedSemaphore,
 ) -> int:
     """
     Download dataset with parallel CSV shards streamed directly to Parquet.
 
     Each shard is streamed into memory, converted to Parquet with string columns,
     then all shard Parquet files are merged into one final Parquet file.
+    request_slots is shared across datasets and caps in-flight shards (and
+    their in-memory CSV buffers) over the whole run.
 
     Returns: row_count
     """
@@ -114,7 +131,7 @@ def dataset_download_sharded(
 
     print(
         f"[{output_name}] downloading {total_rows:,} rows in {total_shards} CSV shards "
-        f"using {SHARD_WORKERS} workers...",
+        f"using up to {workers} workers...",
         flush=True,
     )
 
@@ -127,15 +144,40 @@ def dataset_download_sharded(
     start = time.time()
     last_progress_time = [start]
 
-    def shard_fetch_write(shard_idx: int, shard_name: str, where_clause: str | None) -> Path:
-        """Fetch one CSV shard and write it as a temp Parquet part."""
+    def shard_fetch_write(shard_idx: int, shard_name: str, where_clause: str | None) -> Path | None:
+        """Fetch one CSV shard and write it as a temp Parquet part.
+
+        Returns None for header-only shards, which are skipped without a Parquet pass.
+        """
         nonlocal rows_written, shards_done
-        parquet_path = temp_dir / f"{shard_idx:03d}_{shard_name}.parquet"
-        buffer = io.BytesIO()
-        csv_stream_download(session, dataset_id, where_clause, total_rows, buffer)
-        buffer.seek(0)
-        pl.scan_csv(buffer, infer_schema=False).sink_parquet(parquet_path, compression="zstd")
-        shard_rows = int(pl.scan_parquet(parquet_path).select(pl.len()).collect().item())
+        parquet_path: Path | None = None
+        shard_rows = 0
+        # Hold the slot until the shard buffer is written out and released
+        with request_slots:
+            buffer = io.BytesIO()
+            csv_stream_download(
+                session,
+                dataset_id,
+                where_clause,
+                total_rows,
+                buffer,
+                DATASET_COLUMNS.get(dataset_id),
+            )
+            buffer.seek(0)
+            buffer.readline()
+            has_rows = bool(buffer.read(4096).strip())
+            buffer.seek(0)
+
+            if has_rows:
+                parquet_path = temp_dir / f"{shard_idx:03d}_{shard_name}.parquet"
+                pl.scan_csv(buffer, infer_schema=False).sink_parquet(
+                    parquet_path,
+                    compression="zstd",
+                    row_group_size=PARQUET_ROW_GROUP_SIZE,
+                    maintain_order=False,
+                    engine="streaming",
+                )
+                shard_rows = int(pl.scan_parquet(parquet_path).select(pl.len()).collect().item())
 
         with progress_lock:
             rows_written += shard_rows
@@ -158,17 +200,22 @@ def dataset_download_sharded(
 
     temp_paths: list[Path] = []
     try:
-        with ThreadPoolExecutor(max_workers=SHARD_WORKERS) as executor:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
             futures = [
                 executor.submit(shard_fetch_write, idx, shard_name, where_clause)
                 for idx, (shard_name, where_clause) in enumerate(shards)
             ]
             for future in as_completed(futures):
-                temp_paths.append(future.result())
+                if (parquet_path := future.result()) is not None:
+                    temp_paths.append(parquet_path)
     except Exception:
         shutil.rmtree(temp_dir, ignore_errors=True)
         raise
 
+    if not temp_paths:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise RuntimeError(f"all {total_shards} CSV shards were empty")
+
     download_time = time.time() - start
     mem_after_download = memory_mb()
     rows_per_sec = rows_written / download_time if download_time > 0 else 0
@@ -184,28 +231,41 @@ def dataset_download_sharded(
 
     temp_paths = sorted(temp_paths)
     temp_schema = temp_schema_collect(temp_paths)
-    if output_path.is_dir():
-        shutil.rmtree(output_path)
-    else:
-        output_path.unlink(missing_ok=True)
-    pl.scan_parquet(
-        [str(temp_path) for temp_path in temp_paths],
-        schema=temp_schema,
-        missing_columns="insert",
-        extra_columns="ignore",
-    ).sink_parquet(output_path, compression="zstd")
-
-    merge_time = time.time() - merge_start
-    mem_after_merge = memory_mb()
-
-    shutil.rmtree(temp_dir, ignore_errors=True)
-
-    final_rows = int(pl.scan_parquet(output_path).select(pl.len()).collect().item())
-    if final_rows != rows_written:
-        raise RuntimeError(
-            f"row count mismatch after merge: merged={final_rows:,}, shards={rows_written:,}"
+    # Merge into a private file and rename it into place, so readers and crashed
+    # runs never see a half-written output Parquet.
+    writing_path = output_path.with_name(f"{output_path.name}.writing.{os.getpid()}")
+    try:
+        pl.scan_parquet(
+            [str(temp_path) for temp_path in temp_paths],
+            schema=temp_schema,
+            missing_columns="insert",
+            extra_columns="ignore",
+        ).sink_parquet(
+            writing_path,
+            compression="zstd",
+            row_group_size=PARQUET_ROW_GROUP_SIZE,
+            maintain_order=False,
+            engine="streaming",
+            sync_on_close="all",
         )
 
+        merge_time = time.time() - merge_start
+        mem_after_merge = memory_mb()
+
+        final_rows = int(pl.scan_parquet(writing_path).select(pl.len()).collect().item())
+        if final_rows != rows_written:
+            raise RuntimeError(
+                f"row count mismatch after merge: merged={final_rows:,}, shards={rows_written:,}"
+            )
+
+        if output_path.is_dir():
+            shutil.rmtree(output_path)
+        os.replace(writing_path, output_path)
+        dir_fsync(output_path.parent)
+    finally:
+        writing_path.unlink(missing_ok=True)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
     file_size_mb = path_size_mb(output_path)
     print(
         f"[{output_name}] merged Parquet in {merge_time:.1f}s ({file_size_mb:.1f} MB) "
@@ -221,17 +281,23 @@ def dataset_download_to_parquet(
     dataset_id: str,
     output_name: str,
     verbose: bool,
+    metadata: dict,
+    workers: int,
+    request_slots: threading.BoundedSemaphore,
 ) -> tuple[int, float]:
     """
     Download dataset and save as Parquet using parallel CSV shards.
 
+    Records the download date in the in-memory metadata; the caller saves it.
+
     Returns: (row_count, elapsed_seconds)
     """
     output_path = DIR_PARQUET / f"{output_name}.parquet"
 
     mem_start = memory_mb()
     print(f"[{output_name}] fetching row count... | memory: {mem_start:.1f} MB", flush=True)
-    total_rows = row_count_get(session, dataset_id)
+    with request_slots:
+        total_rows = row_count_get(session, dataset_id)
 
     if total_rows is None or total_rows == 0:
         print(f"[{output_name}] no rows found or count failed", flush=True)
@@ -242,12 +308,19 @@ def dataset_download_to_parquet(
     start = time.time()
 
     row_count = dataset_download_sharded(
-        session, dataset_id, output_name, output_path, verbose, total_rows
+        session,
+        dataset_id,
+        output_name,
+        output_path,
+        verbose,
+        total_rows,
+        workers,
+        request_slots,
     )
 
     # Update metadata
     today = datetime.now().strftime("%Y%m%d")
-    last_download_date_set(dataset_id, today)
+    last_download_date_set(metadata, dataset_id, today)
 
     total_time = time.time() - start
     file_size_mb = path_size_mb(output_path)
@@ -295,6 +368,12 @@ Examples:
         action="store_true",
         help="Show detailed progress",
     )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        help="Concurrent RDW requests across all datasets (default: $RDW_MAX_PARALLEL or 8)",
+    )
     args = parser.parse_args()
 
     if not args.dataset_id and not args.all:
@@ -304,8 +383,6 @@ Examples:
     env_load()
     DIR_PARQUET.mkdir(parents=True, exist_ok=True)
 
-    session = session_create()
-
     # Determine which datasets to download
     if args.all:
         datasets_to_download = list(DATASETS.items())
@@ -316,26 +393,48 @@ Examples:
             sys.exit(1)
         datasets_to_download = [(args.dataset_id, DATASETS[args.dataset_id])]
 
+    workers = max(1, args.workers) if args.workers else parallel_workers_get()
+    # One request budget shared by every dataset, so --all never runs more
+    # concurrent RDW connections (or in-memory shards) than a single dataset
+    request_slots = threading.BoundedSemaphore(workers)
+    session = session_create(pool_size=workers)
+
     print(f"Downloading {len(datasets_to_download)} dataset(s) to {DIR_PARQUET}")
     print()
 
     total_start = time.time()
     total_rows = 0
     failed = []
+    metadata = metadata_load()
 
-    for dataset_id, output_name in datasets_to_download:
-        try:
-            row_count, _ = dataset_download_to_parquet(
-                session=session,
-                dataset_id=dataset_id,
-                output_name=output_name,
-                verbose=args.verbose,
-            )
-            total_rows += row_count
-        except Exception as e:
-            print(f"[{output_name}] FAILED: {e}", flush=True)
-            failed.append(output_name)
-        print()
+    # Datasets are independent, so download them concurrently; their shards
+    # draw from the shared request_slots budget.
+    try:
+        with ThreadPoolExecutor(max_workers=len(datasets_to_download)) as executor:
+            futures = {
+                executor.submit(
+                    dataset_download_to_parquet,
+                    session=session,
+                    dataset_id=dataset_id,
+                    output_name=output_name,
+                    verbose=args.verbose,
+                    metadata=metadata,
+                    workers=workers,
+                    request_slots=request_slots,
+                ): output_name
+                for dataset_id, output_name in datasets_to_download
+            }
+            for future in as_completed(futures):
+                output_name = futures[future]
+                try:
+                    row_count, _ = future.result()
+                    total_rows += row_count
+                except Exception as e:
+                    print(f"[{output_name}] FAILED: {e}", flush=True)
+                    failed.append(output_name)
+    finally:
+        metadata_save(metadata)
+    print()
 
     total_time = time.time() - total_start
 
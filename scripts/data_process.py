@@ -9,8 +9,7 @@ Uses Polars lazy API throughout to minimize memory usage.
 """
 
 import ctypes
-import gc
-from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from time import monotonic
 
@@ -20,7 +19,7 @@ from config import (
     THRESHOLD_BRAND,
     THRESHOLD_MODEL,
 )
-from defect_build import build_defect_breakdowns, build_defect_codes, build_defect_stats
+from defect_build import build_defect_codes, build_defect_outputs
 from fuel_build import build_fuel_breakdown
 from inspection_prepare import json_save, load_dataset, scan_dataset
 from inspection_stats import (
@@ -32,8 +31,11 @@ from system_utils import memory_mb, path_remove, path_size_mb
 
 
 def memory_release() -> None:
-    """Release freed Python and libc memory back to the OS on Linux runners."""
-    gc.collect()
+    """Return freed libc heap memory to the OS on Linux runners.
+
+    Phase intermediates are freed by reference counting when they go out of
+    scope, so no full gc.collect() pass is needed here.
+    """
     try:
         ctypes.CDLL("libc.so.6").malloc_trim(0)
     except OSError:
@@ -56,41 +58,24 @@ def phase_done(name: str, started: float, detail: str = "") -> None:
     )
 
 
-def _add_fuel_and_track_ranges(
-    stats_list: list[dict], fuel_dict: dict, key_extractor: Callable[[dict], str]
-) -> tuple[int, int, int]:
-    """Add fuel breakdown to stats and compute max fleet size, and min/max inspections."""
-    max_fleet_size = 0
-    min_inspections: int | float = float("inf") if stats_list else 0
-    max_inspections = 0
-    default_fuel = {"Benzine": 0, "Diesel": 0, "Elektriciteit": 0, "LPG": 0, "other": 0}
-
-    for stat in stats_list:
-        key = key_extractor(stat)
-        stat["fuel_breakdown"] = fuel_dict.get(key, default_fuel)
-
-        vc = stat["vehicle_count"]
-        ti = stat["total_inspections"]
-        if vc > max_fleet_size:
-            max_fleet_size = vc
-        if ti < min_inspections:
-            min_inspections = ti
-        if ti > max_inspections:
-            max_inspections = ti
-
-    if min_inspections == float("inf"):
-        min_inspections = 0
-
-    return max_fleet_size, int(min_inspections), max_inspections
+def _stats_ranges_track(stats_list: list[dict]) -> tuple[int, int, int]:
+    """Compute max fleet size, and min/max inspections over aggregated stats."""
+    if not stats_list:
+        return 0, 0, 0
+    inspections = [stat["total_inspections"] for stat in stats_list]
+    max_fleet_size = max(stat["vehicle_count"] for stat in stats_list)
+    return max_fleet_size, min(inspections), max(inspections)
 
 
 def main() -> None:
     """Main entry point for the data processing script."""
     print(f"Stage2: Processing (Polars native) | memory: {memory_mb():.0f} MB", flush=True)
     start_time = datetime.now()
+    # One timestamp shared by every output generated in this run
+    generated_at = start_time.isoformat()
 
-    # Load reference data (small, load fully)
-    gebreken_df = load_dataset("gebreken")
+    # Load reference data (small, load fully; only the columns Stage 2 reads)
+    gebreken_df = load_dataset("gebreken", columns=["gebrek_identificatie", "gebrek_omschrijving"])
     print(f"Loaded gebreken ({len(gebreken_df):,} rows) | memory: {memory_mb():.0f} MB", flush=True)
 
     # Scan large datasets lazily
@@ -116,37 +101,35 @@ def main() -> None:
     )
     memory_release()
 
+    # Build fuel breakdowns first so they are joined onto the stats in Polars
+    phase = phase_start("build fuel breakdowns")
+    brand_fuel, model_fuel = build_fuel_breakdown(brandstof_lf, vehicles_lf)
+    phase_done(
+        "build fuel breakdowns", phase, f"brands={len(brand_fuel)}, models={len(model_fuel)}"
+    )
+    memory_release()
+
     # Aggregate by brand and model (returns stats + age range)
     phase = phase_start("aggregate brand statistics")
-    brand_stats, min_age, max_age = aggregate_brand_stats(inspection_stats_lf)
+    brand_stats, min_age, max_age = aggregate_brand_stats(inspection_stats_lf, brand_fuel)
     phase_done("aggregate brand statistics", phase, f"brands={len(brand_stats)}")
     memory_release()
 
     phase = phase_start("aggregate model statistics")
-    model_stats, _, _ = aggregate_model_stats(inspection_stats_lf)
+    model_stats, _, _ = aggregate_model_stats(inspection_stats_lf, model_fuel)
     phase_done("aggregate model statistics", phase, f"models={len(model_stats)}")
     memory_release()
     print(f"Age range: {min_age}-{max_age}", flush=True)
 
-    # Build fuel breakdowns
-    phase = phase_start("build fuel breakdowns")
-    brand_fuel, model_fuel = build_fuel_breakdown(brandstof_lf, vehicles_lf)
-    phase_done(
-        "build fuel breakdowns", phase, f"brands={len(brand_fuel)}, models={len(model_fuel)}"
-    )
-    memory_release()
-
-    # Add fuel_breakdown and calculate ranges in single pass for efficiency
-    max_fleet_size_brand, min_inspections_brand, max_inspections_brand = _add_fuel_and_track_ranges(
-        brand_stats, brand_fuel, lambda stat: stat["merk"]
+    max_fleet_size_brand, min_inspections_brand, max_inspections_brand = _stats_ranges_track(
+        brand_stats
     )
-
-    max_fleet_size_model, min_inspections_model, max_inspections_model = _add_fuel_and_track_ranges(
-        model_stats, model_fuel, lambda stat: f"{stat['merk']}|{stat['handelsbenaming']}"
+    max_fleet_size_model, min_inspections_model, max_inspections_model = _stats_ranges_track(
+        model_stats
     )
 
     # Generate rankings
-    rankings = generate_rankings(brand_stats, model_stats)
+    rankings = generate_rankings(brand_stats, model_stats, generated_at)
 
     phase = phase_start("collect metadata summaries")
     metadata_stats = metadata_stats_collect(inspection_stats_lf)
@@ -164,7 +147,7 @@ def main() -> None:
 
     # Build metadata
     metadata = {
-        "generated_at": datetime.now().isoformat(),
+        "generated_at": generated_at,
         "thresholds": {
             "brand": THRESHOLD_BRAND,
             "model": THRESHOLD_MODEL,
@@ -196,20 +179,20 @@ def main() -> None:
         "fleet_age_stats": metadata_stats["fleet_age_stats"],
     }
 
-    # Build defect stats
-    phase = phase_start("build defect statistics")
-    defect_stats = build_defect_stats(defects_lf, gebreken_df, total_inspections)
-    phase_done("build defect statistics", phase, f"defect_types={len(defect_stats['top_defects'])}")
-    memory_release()
-
-    # Build per-defect breakdowns for dynamic frontend filtering
-    phase = phase_start("build defect breakdowns")
-    brand_defect_breakdown, model_defect_breakdown = build_defect_breakdowns(
-        defects_lf, inspection_stats_lf
+    # Build defect stats and per-defect breakdowns for dynamic frontend filtering
+    phase = phase_start("build defect statistics and breakdowns")
+    defect_stats, brand_defect_breakdown, model_defect_breakdown = build_defect_outputs(
+        defects_lf,
+        inspection_stats_lf,
+        gebreken_df,
+        total_inspections,
+        total_defects,
+        generated_at,
     )
     phase_done(
-        "build defect breakdowns",
+        "build defect statistics and breakdowns",
         phase,
+        f"defect_types={len(defect_stats['top_defects'])}, "
         f"brands={len(brand_defect_breakdown)}, models={len(model_defect_breakdown)}",
     )
     memory_release()
@@ -222,16 +205,24 @@ def main() -> None:
     DIR_PROCESSED.mkdir(parents=True, exist_ok=True)
 
     phase = phase_start("write processed JSON")
-    json_save(brand_stats, DIR_PROCESSED / "brand_stats.json")
-    json_save(model_stats, DIR_PROCESSED / "model_stats.json")
-
-    # Use json_save for dicts (rankings, metadata, defect_stats, defect breakdowns)
-    json_save(rankings, DIR_PROCESSED / "rankings.json")
-    json_save(metadata, DIR_PROCESSED / "metadata.json")
-    json_save(defect_stats, DIR_PROCESSED / "defect_stats.json")
-    json_save(brand_defect_breakdown, DIR_PROCESSED / "brand_defect_breakdown.json")
-    json_save(model_defect_breakdown, DIR_PROCESSED / "model_defect_breakdown.json")
-    json_save(defect_codes, DIR_PROCESSED / "defect_codes.json")
+    outputs = {
+        "brand_stats.json": brand_stats,
+        "model_stats.json": model_stats,
+        "rankings.json": rankings,
+        "metadata.json": metadata,
+        "defect_stats.json": defect_stats,
+        "brand_defect_breakdown.json": brand_defect_breakdown,
+        "model_defect_breakdown.json": model_defect_breakdown,
+        "defect_codes.json": defect_codes,
+    }
+    # Files are independent, so overlap their serialization and writes
+    with ThreadPoolExecutor(max_workers=len(outputs)) as executor:
+        futures = [
+            executor.submit(json_save, data, DIR_PROCESSED / filename)
+            for filename, data in outputs.items()
+        ]
+        for future in futures:
+            future.result()
     phase_done("write processed JSON", phase)
     memory_release()
 
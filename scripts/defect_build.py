@@ -4,35 +4,43 @@ Defect data building functions.
 Builds defect statistics, breakdowns, and code indexes for frontend consumption.
 """
 
-from datetime import datetime
-
 import polars as pl
 
 
-def build_defect_stats(
-    defects_lf: pl.LazyFrame, gebreken_df: pl.DataFrame, total_inspections: int
-) -> dict:
-    """Build defect type statistics."""
-    # Count defects by type
-    defect_counts = (
+def _defect_count_expr() -> pl.Expr:
+    """Return the per-row defect count, counting a missing amount as one defect."""
+    return pl.col("aantal_gebreken_geconstateerd").fill_null(1).cast(pl.Int64)
+
+
+def _defect_type_counts_lazy(defects_lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Build the lazy top-50 defect counts per defect type."""
+    return (
         defects_lf.group_by("gebrek_identificatie")
-        .agg(
-            [
-                pl.col("aantal_gebreken_geconstateerd")
-                .fill_null(1)
-                .cast(pl.Int64)
-                .sum()
-                .alias("count"),
-            ]
-        )
+        .agg(_defect_count_expr().sum().alias("count"))
+        .top_k(50, by="count")
         .sort("count", descending=True)
-        .head(50)
-        .collect(engine="streaming")
     )
 
-    # Calculate total defects for percentage calculation
-    total_defects = defect_counts["count"].sum()
 
+def _defect_total_lazy(defects_lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Build the lazy total defect count over all defect types (percentage base)."""
+    return defects_lf.select(_defect_count_expr().sum().alias("all_defects"))
+
+
+def _defect_stats_format(
+    defect_counts: pl.DataFrame,
+    all_defects: int,
+    gebreken_df: pl.DataFrame,
+    total_inspections: int,
+    total_defects: int,
+    generated_at: str,
+) -> dict:
+    """Format collected defect type counts as the defect statistics output.
+
+    Percentages are relative to all raw defects, not only the top-50 types.
+    total_defects and total_inspections both come from the inspection stats,
+    so avg_defects_per_inspection compares the same population.
+    """
     # Join with descriptions and compute all fields using Polars
     top_defects = (
         defect_counts.join(
@@ -42,7 +50,7 @@ def build_defect_stats(
         )
         .with_columns(
             [
-                (pl.col("count") / total_defects * 100).round(2).alias("percentage"),
+                (pl.col("count") / all_defects * 100).round(2).alias("percentage"),
                 pl.col("gebrek_omschrijving")
                 .fill_null("Onbekend gebrek")
                 .alias("defect_description"),
@@ -60,23 +68,25 @@ def build_defect_stats(
         if total_inspections > 0
         else 0,
         "top_defects": top_defects,
-        "generated_at": datetime.now().isoformat(),
+        "generated_at": generated_at,
     }
 
 
-def build_defect_breakdowns(
-    defects_lf: pl.LazyFrame,
-    inspections_lf: pl.LazyFrame,
-) -> tuple[dict[str, dict[str, int]], dict[str, dict[str, int]]]:
-    """Build per-defect-code counts for each brand and model.
+def _defect_counts_by_key(breakdown_df: pl.DataFrame, key_col: str) -> dict[str, dict[str, int]]:
+    """Split flat (key, defect code, count) rows into one code -> count dict per key."""
+    return {
+        key: dict(zip(part["gebrek_identificatie"].to_list(), part["count"].to_list()))
+        for (key,), part in breakdown_df.partition_by(
+            key_col, as_dict=True, include_key=False
+        ).items()
+    }
 
-    This enables the frontend to dynamically recalculate reliability
-    metrics when users toggle which defects count as reliability indicators.
 
-    Returns:
-        Tuple of (brand_defects, model_defects) where each is a dict mapping
-        brand/model name to a dict of defect_code -> count
-    """
+def _defect_breakdowns_lazy(
+    defects_lf: pl.LazyFrame,
+    inspections_lf: pl.LazyFrame,
+) -> tuple[pl.LazyFrame, pl.LazyFrame]:
+    """Build lazy flat (key, defect code, count) plans per brand and per model."""
     insp_keys_lf = inspections_lf.select(
         [
             "kenteken",
@@ -94,7 +104,7 @@ def build_defect_breakdowns(
             "meld_datum_door_keuringsinstantie",
             "meld_tijd_door_keuringsinstantie",
             "gebrek_identificatie",
-            pl.col("aantal_gebreken_geconstateerd").fill_null(1).cast(pl.Int64).alias("count"),
+            _defect_count_expr().alias("count"),
         ]
     ).join(
         insp_keys_lf,
@@ -106,42 +116,65 @@ def build_defect_breakdowns(
         how="inner",
     )
 
-    # 3. Optimized Aggregation using Structs + Collect All
+    # 3. Aggregate to flat (key, defect code, count) rows
     # Brand Breakdown
-    brand_agg_lazy = (
-        defects_with_brand_lf.group_by(["merk", "gebrek_identificatie"])
-        .agg(pl.col("count").sum())
-        .group_by("merk")
-        .agg(pl.struct(["gebrek_identificatie", "count"]).alias("defects"))
+    brand_agg_lazy = defects_with_brand_lf.group_by(["merk", "gebrek_identificatie"]).agg(
+        pl.col("count").sum()
     )
 
-    # Model Breakdown
+    # Model Breakdown: group on the two key columns, then build the "merk|model"
+    # string only for the aggregated rows (re-summed so null keys still merge)
     model_agg_lazy = (
-        defects_with_brand_lf.with_columns(
-            (pl.col("merk") + "|" + pl.col("handelsbenaming")).alias("model_key")
-        )
+        defects_with_brand_lf.group_by(["merk", "handelsbenaming", "gebrek_identificatie"])
+        .agg(pl.col("count").sum())
+        .with_columns((pl.col("merk") + "|" + pl.col("handelsbenaming")).alias("model_key"))
         .group_by(["model_key", "gebrek_identificatie"])
         .agg(pl.col("count").sum())
-        .group_by("model_key")
-        .agg(pl.struct(["gebrek_identificatie", "count"]).alias("defects"))
     )
 
-    brand_breakdown_df, model_breakdown_df = pl.collect_all(
-        [brand_agg_lazy, model_agg_lazy],
-        engine="streaming",
-    )
+    return brand_agg_lazy, model_agg_lazy
 
-    brand_defects: dict[str, dict[str, int]] = {}
-    # Use iter_rows assuming column order: merk, defects
-    for brand, defects_structs in brand_breakdown_df.iter_rows():
-        brand_defects[brand] = {d["gebrek_identificatie"]: d["count"] for d in defects_structs}
 
-    model_defects: dict[str, dict[str, int]] = {}
-    # Use iter_rows assuming column order: model_key, defects
-    for model_key, defects_structs in model_breakdown_df.iter_rows():
-        model_defects[model_key] = {d["gebrek_identificatie"]: d["count"] for d in defects_structs}
+def build_defect_outputs(
+    defects_lf: pl.LazyFrame,
+    inspections_lf: pl.LazyFrame,
+    gebreken_df: pl.DataFrame,
+    total_inspections: int,
+    total_defects: int,
+    generated_at: str,
+) -> tuple[dict, dict[str, dict[str, int]], dict[str, dict[str, int]]]:
+    """Build defect statistics and per-defect-code brand/model breakdowns.
+
+    The breakdowns let the frontend dynamically recalculate reliability
+    metrics when users toggle which defects count as reliability indicators.
+    All three plans read the defects dataset, so they are collected together.
 
-    return brand_defects, model_defects
+    Returns:
+        Tuple of (defect_stats, brand_defects, model_defects) where the
+        breakdowns map brand/model name to a dict of defect_code -> count
+    """
+    brand_agg_lazy, model_agg_lazy = _defect_breakdowns_lazy(defects_lf, inspections_lf)
+    defect_counts_df, defect_total_df, brand_breakdown_df, model_breakdown_df = pl.collect_all(
+        [
+            _defect_type_counts_lazy(defects_lf),
+            _defect_total_lazy(defects_lf),
+            brand_agg_lazy,
+            model_agg_lazy,
+        ],
+        engine="streaming",
+    )
+
+    defect_stats = _defect_stats_format(
+        defect_counts_df,
+        defect_total_df.item() or 0,
+        gebreken_df,
+        total_inspections,
+        total_defects,
+        generated_at,
+    )
+    brand_defects = _defect_counts_by_key(brand_breakdown_df, "merk")
+    model_defects = _defect_counts_by_key(model_breakdown_df, "model_key")
+    return defect_stats, brand_defects, model_defects
 
 
 def build_defect_codes(gebreken_df: pl.DataFrame) -> dict[str, str]:
@@ -149,4 +182,9 @@ def build_defect_codes(gebreken_df: pl.DataFrame) -> dict[str, str]:
     df = gebreken_df.filter(
         pl.col("gebrek_identificatie").is_not_null() & (pl.col("gebrek_identificatie") != "")
     ).select(pl.col("gebrek_identificatie"), pl.col("gebrek_omschrijving").fill_null(""))
-    return dict(zip(df.get_column("gebrek_identificatie"), df.get_column("gebrek_omschrijving")))
+    return dict(
+        zip(
+            df.get_column("gebrek_identificatie").to_list(),
+            df.get_column("gebrek_omschrijving").to_list(),
+        )
+    )
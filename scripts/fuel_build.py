@@ -8,53 +8,56 @@ import polars as pl
 
 from config import KNOWN_FUEL_TYPES
 
+# Struct field order of every fuel_breakdown value
+FUEL_BREAKDOWN_FIELDS = sorted(KNOWN_FUEL_TYPES) + ["other"]
 
-def _build_fuel_dict(df: pl.DataFrame, key_col: str) -> dict[str, dict[str, int]]:
-    """Build fuel dictionary using Polars struct aggregation.
+
+def _fuel_breakdown_frame(counts: pl.DataFrame, key_cols: list[str]) -> pl.DataFrame:
+    """Pivot per-fuel counts into one fuel_breakdown struct per key.
 
     Args:
-        df: DataFrame containing at least key_col, "fuel_type", and "kenteken".
-        key_col: The column name to group by (e.g., "merk" or "model_key").
+        counts: DataFrame with key_cols, "fuel_type" and "count".
+        key_cols: Columns identifying a brand or model (e.g. ["merk"]).
 
     Returns:
-        Dictionary mapping key_col values to fuel breakdown dicts.
+        DataFrame with key_cols and a fuel_breakdown struct column.
     """
-    # 1. Aggregate counts by key and fuel type
-    counts = df.group_by([key_col, "fuel_type"]).agg(pl.col("kenteken").n_unique().alias("count"))
-
-    # 2. Pivot to wide format so fuel types become columns
-    # We use "count" as values. Missing combinations get null, which we fill with 0.
-    pivoted = counts.pivot(index=key_col, on="fuel_type", values="count").fill_null(0)
-
-    # 3. Ensure all known fuel types + "other" are present as columns
-    # Sort to ensure consistent field order in the struct/dict
-    expected_cols = sorted(list(KNOWN_FUEL_TYPES)) + ["other"]
-    existing_cols = set(pivoted.columns)
+    pivoted = counts.pivot(index=key_cols, on="fuel_type", values="count").fill_null(0)
 
-    # Add missing columns with 0
-    missing_cols = [col for col in expected_cols if col not in existing_cols]
+    missing_cols = [col for col in FUEL_BREAKDOWN_FIELDS if col not in pivoted.columns]
     if missing_cols:
         pivoted = pivoted.with_columns([pl.lit(0).alias(col) for col in missing_cols])
 
-    # 4. Create struct column with all fuel counts
-    # The struct fields will follow the order in expected_cols
-    struct_df = pivoted.select(pl.col(key_col), pl.struct(expected_cols).alias("fuel_breakdown"))
+    return pivoted.select(
+        *key_cols,
+        pl.struct(pl.col(FUEL_BREAKDOWN_FIELDS).cast(pl.Int64)).alias("fuel_breakdown"),
+    )
+
 
-    # 5. Convert directly to dictionary
-    # to_list() on a struct column returns a list of dictionaries
-    return dict(zip(struct_df[key_col], struct_df["fuel_breakdown"].to_list()))
+def fuel_breakdown_attach(
+    stats_df: pl.DataFrame, fuel_df: pl.DataFrame, key_cols: list[str]
+) -> pl.DataFrame:
+    """Left-join fuel breakdowns onto stats rows, defaulting missing keys to zero counts.
+
+    Null keys match each other (e.g. a model without handelsbenaming), so such
+    rows keep their own fuel counts instead of falling back to zero.
+    """
+    empty_breakdown = pl.struct([pl.lit(0, dtype=pl.Int64).alias(f) for f in FUEL_BREAKDOWN_FIELDS])
+    return stats_df.join(
+        fuel_df, on=key_cols, how="left", maintain_order="left", nulls_equal=True
+    ).with_columns(pl.col("fuel_breakdown").fill_null(empty_breakdown))
 
 
 def build_fuel_breakdown(
     brandstof_lf: pl.LazyFrame,
     vehicles_lf: pl.LazyFrame,
-) -> tuple[dict[str, dict[str, int]], dict[str, dict[str, int]]]:
+) -> tuple[pl.DataFrame, pl.DataFrame]:
     """Build fuel type breakdown per brand and model.
 
     Returns:
-        Tuple of (brand_fuel, model_fuel) where each is a dict mapping
-        brand/model name to FuelBreakdown dict with keys:
-        Benzine, Diesel, Elektriciteit, LPG, other
+        Tuple of (brand_fuel, model_fuel) DataFrames keyed by merk and by
+        merk + handelsbenaming, each with a fuel_breakdown struct of
+        Benzine, Diesel, Elektriciteit, LPG, other counts
     """
     # Join brandstof with vehicles to get brand/model info
     # Note: a vehicle can have multiple fuel entries (e.g., hybrid)
@@ -94,44 +97,9 @@ def build_fuel_breakdown(
         .collect(engine="streaming")
     )
 
-    # Create model_key on the aggregated result (much smaller)
-    model_fuel_stats_df = raw_stats_df.with_columns(
-        (pl.col("merk") + "|" + pl.col("handelsbenaming")).alias("model_key")
-    )
-
-    # Aggregate by brand from the materialized stats
-    brand_fuel_df = (
-        model_fuel_stats_df.group_by(["merk", "fuel_type"]).agg(pl.col("count").sum()).to_dicts()
-    )
-
-    # Model stats is already aggregated
-    model_fuel_df = model_fuel_stats_df.select(["model_key", "fuel_type", "count"]).to_dicts()
-
-    # Initialize empty FuelBreakdown for each brand
-    empty_breakdown = {
-        "Benzine": 0,
-        "Diesel": 0,
-        "Elektriciteit": 0,
-        "LPG": 0,
-        "other": 0,
-    }
-
-    brand_fuel: dict[str, dict[str, int]] = {}
-    for row in brand_fuel_df:
-        brand = row["merk"]
-        fuel = row["fuel_type"]
-        count = row["count"]
-        if brand not in brand_fuel:
-            brand_fuel[brand] = empty_breakdown.copy()
-        brand_fuel[brand][fuel] = count
-
-    model_fuel: dict[str, dict[str, int]] = {}
-    for row in model_fuel_df:
-        model = row["model_key"]
-        fuel = row["fuel_type"]
-        count = row["count"]
-        if model not in model_fuel:
-            model_fuel[model] = empty_breakdown.copy()
-        model_fuel[model][fuel] = count
+    # Aggregate by brand from the materialized model stats
+    brand_counts_df = raw_stats_df.group_by(["merk", "fuel_type"]).agg(pl.col("count").sum())
 
+    brand_fuel = _fuel_breakdown_frame(brand_counts_df, ["merk"])
+    model_fuel = _fuel_breakdown_frame(raw_stats_df, ["merk", "handelsbenaming"])
     return brand_fuel, model_fuel
@@ -4,10 +4,10 @@ Helper utilities for Stage 2 inspection preparation and I/O.
 Uses Polars lazy API for memory-efficient processing - avoids Python dict conversion.
 """
 
-import json
 from pathlib import Path
 from typing import Any
 
+import orjson
 import polars as pl
 
 from config import DIR_PARQUET
@@ -53,11 +53,12 @@ def load_dataset(dataset_name: str, columns: list[str] | None = None) -> pl.Data
 def json_save(data: Any, filepath: Path) -> None:
     """Save data to a JSON file.
 
-    Uses native Polars write_json for DataFrames, Python json for dicts.
+    Uses native Polars write_json for DataFrames, orjson for dicts and lists.
     """
     filepath.parent.mkdir(parents=True, exist_ok=True)
     if isinstance(data, pl.DataFrame):
         data.write_json(filepath)
     else:
-        with open(filepath, "w", encoding="utf-8") as file_handle:
-            json.dump(data, file_handle, ensure_ascii=False, indent=2)
+        filepath.write_bytes(
+            orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        )
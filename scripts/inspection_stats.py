@@ -12,32 +12,49 @@ import polars as pl
 
 from system_utils import path_remove
 
+# Bit per known fuel, OR-reduced per license plate in _determine_primary_fuel.
+_FUEL_BITS = {"Benzine": 1, "Diesel": 2, "Elektriciteit": 4, "LPG": 8}
+
+# Low-cardinality group keys are Enums so group_by hashes integer codes.
+# Categories are in lexical order so sorts match the former string columns.
+_PRIMARY_FUEL_ENUM = pl.Enum(["Benzine", "Diesel", "Elektriciteit", "Hybrid", "LPG", "Other"])
+_VEHICLE_TYPE_ENUM = pl.Enum(["commercial", "consumer"])
+
+# Join key between primary inspections and their aggregated defect counts.
+_INSPECTION_KEY = [
+    "_prefix",
+    "kenteken",
+    "meld_datum_door_keuringsinstantie",
+    "meld_tijd_door_keuringsinstantie",
+]
+
 
 def _determine_primary_fuel(brandstof_lf: pl.LazyFrame) -> pl.LazyFrame:
     """Determine a single primary fuel category per license plate."""
-    fuel_indicators = brandstof_lf.group_by("kenteken").agg(
-        [
-            (pl.col("brandstof_omschrijving") == "Elektriciteit").any().alias("has_electric"),
-            (pl.col("brandstof_omschrijving") == "Benzine").any().alias("has_benzine"),
-            (pl.col("brandstof_omschrijving") == "Diesel").any().alias("has_diesel"),
-            (pl.col("brandstof_omschrijving") == "LPG").any().alias("has_lpg"),
-        ]
+    fuel_masks = brandstof_lf.group_by("kenteken").agg(
+        pl.col("brandstof_omschrijving")
+        .replace_strict(_FUEL_BITS, default=0, return_dtype=pl.UInt8)
+        .bitwise_or()
+        .alias("fuel_mask")
     )
 
-    return fuel_indicators.select(
+    mask = pl.col("fuel_mask")
+    has_electric = (mask & 4) != 0
+    return fuel_masks.select(
         [
             "kenteken",
-            pl.when(pl.col("has_lpg"))
+            pl.when((mask & 8) != 0)
             .then(pl.lit("LPG"))
-            .when(pl.col("has_electric") & (pl.col("has_benzine") | pl.col("has_diesel")))
+            .when(has_electric & ((mask & 3) != 0))
             .then(pl.lit("Hybrid"))
-            .when(pl.col("has_electric"))
+            .when(has_electric)
             .then(pl.lit("Elektriciteit"))
-            .when(pl.col("has_diesel"))
+            .when((mask & 2) != 0)
             .then(pl.lit("Diesel"))
-            .when(pl.col("has_benzine"))
+            .when((mask & 1) != 0)
             .then(pl.lit("Benzine"))
             .otherwise(pl.lit("Other"))
+            .cast(_PRIMARY_FUEL_ENUM)
             .alias("primary_fuel"),
         ]
     )
@@ -54,6 +71,11 @@ def _normalized_time() -> pl.Expr:
     )
 
 
+def _date_year(column: str) -> pl.Expr:
+    """Return the year of an RDW YYYYMMDD date string via one integer cast."""
+    return pl.col(column).cast(pl.Int32) // 10_000
+
+
 def _kenteken_prefix() -> pl.Expr:
     """Return the partition prefix used for bounded checkpoint joins."""
     return pl.col("kenteken").str.slice(0, 1).str.to_uppercase().fill_null("").alias("_prefix")
@@ -78,10 +100,7 @@ def _primary_inspection_keys(inspections_lf: pl.LazyFrame) -> pl.LazyFrame:
         .with_columns(
             [
                 _kenteken_prefix(),
-                pl.col("meld_datum_door_keuringsinstantie")
-                .str.slice(0, 4)
-                .cast(pl.Int32)
-                .alias("insp_year"),
+                _date_year("meld_datum_door_keuringsinstantie").alias("insp_year"),
             ]
         )
     )
@@ -102,14 +121,7 @@ def _defect_counts_build(defects_lf: pl.LazyFrame) -> pl.LazyFrame:
             ]
         )
         .with_columns(_kenteken_prefix())
-        .group_by(
-            [
-                "_prefix",
-                "kenteken",
-                "meld_datum_door_keuringsinstantie",
-                "meld_tijd_door_keuringsinstantie",
-            ]
-        )
+        .group_by(_INSPECTION_KEY)
         .agg(pl.col("aantal_gebreken_geconstateerd").sum().alias("defect_count"))
     )
 
@@ -126,17 +138,17 @@ def _vehicle_attributes_build(vehicles_lf: pl.LazyFrame) -> pl.LazyFrame:
                 .str.to_uppercase()
                 .str.strip_chars()
                 .alias("handelsbenaming"),
-                "datum_eerste_toelating",
+                _date_year("datum_eerste_toelating").alias("reg_year"),
                 pl.col("catalogusprijs").cast(pl.Float64).fill_null(0).alias("catalogusprijs"),
                 pl.when(pl.col("voertuigsoort") == "Personenauto")
                 .then(pl.lit("consumer"))
                 .when(pl.col("voertuigsoort") == "Bedrijfsauto")
                 .then(pl.lit("commercial"))
-                .otherwise(pl.lit("other"))
+                .cast(_VEHICLE_TYPE_ENUM)
                 .alias("vehicle_type_group"),
             ]
         )
-        .filter(pl.col("vehicle_type_group").is_in(["consumer", "commercial"]))
+        .filter(pl.col("vehicle_type_group").is_not_null())
         .unique(subset=["kenteken"], keep="first")
     )
 
@@ -151,21 +163,11 @@ def _inspection_stats_join(
     return (
         primary_inspections.join(vehicle_columns, on=["_prefix", "kenteken"], how="inner")
         .join(fuel_types, on=["_prefix", "kenteken"], how="left")
-        .join(
-            defect_counts,
-            on=[
-                "_prefix",
-                "kenteken",
-                "meld_datum_door_keuringsinstantie",
-                "meld_tijd_door_keuringsinstantie",
-            ],
-            how="left",
-        )
+        .join(defect_counts, on=_INSPECTION_KEY, how="left")
         .with_columns(
             [
-                pl.col("primary_fuel").fill_null("Other"),
-                pl.col("datum_eerste_toelating").str.slice(0, 4).cast(pl.Int32).alias("reg_year"),
-                pl.col("defect_count").fill_null(0),
+                pl.col("primary_fuel").fill_null(pl.lit("Other", dtype=_PRIMARY_FUEL_ENUM)),
+                pl.col("defect_count").fill_null(0).cast(pl.Int32),
             ]
         )
         .with_columns((pl.col("insp_year") - pl.col("reg_year")).alias("age_at_inspection"))
@@ -290,7 +292,7 @@ def metadata_stats_collect(inspections_lf: pl.LazyFrame) -> dict[str, Any]:
     summary_lf = inspections_lf.select(
         [
             pl.len().alias("total_inspections"),
-            pl.col("defect_count").sum().cast(pl.Int64).alias("total_defects"),
+            pl.col("defect_count").cast(pl.Int64).sum().alias("total_defects"),
             pl.col("kenteken").n_unique().alias("total_vehicles"),
             pl.col("catalogusprijs").max().cast(pl.Int64).alias("max_price"),
             (pl.col("defect_count") == 0).sum().alias("zero_defect_inspections"),
@@ -312,7 +314,7 @@ def metadata_stats_collect(inspections_lf: pl.LazyFrame) -> dict[str, Any]:
         .agg(
             [
                 pl.len().alias("inspections"),
-                pl.col("defect_count").sum().alias("total_defects"),
+                pl.col("defect_count").cast(pl.Int64).sum().alias("total_defects"),
             ]
         )
         .with_columns(
@@ -329,7 +331,7 @@ def metadata_stats_collect(inspections_lf: pl.LazyFrame) -> dict[str, Any]:
         .agg(
             [
                 pl.len().alias("total_inspections"),
-                pl.col("defect_count").sum().alias("total_defects"),
+                pl.col("defect_count").cast(pl.Int64).sum().alias("total_defects"),
                 pl.col("kenteken").n_unique().alias("vehicle_count"),
             ]
         )
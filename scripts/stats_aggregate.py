@@ -5,7 +5,7 @@ Computes reliability statistics using native Polars operations.
 Per-year statistics replace fixed age brackets for fine-grained filtering.
 """
 
-from datetime import datetime
+import heapq
 
 import polars as pl
 
@@ -16,32 +16,18 @@ from config import (
     THRESHOLD_MODEL,
     THRESHOLD_MODEL_RANKING,
 )
+from fuel_build import fuel_breakdown_attach
 
 
-def compute_per_year_stats(
-    inspections_lf: pl.LazyFrame, group_cols: list[str]
-) -> tuple[pl.LazyFrame, int, int]:
-    """Compute statistics for each age year using native Polars.
-
-    Returns:
-        Tuple of (per_year_df, min_age, max_age)
-    """
-    age_bounds = inspections_lf.select(
-        [
-            pl.col("age_at_inspection").min().alias("min_age"),
-            pl.col("age_at_inspection").max().alias("max_age"),
-        ]
-    ).collect(engine="streaming")
-    min_age = int(age_bounds["min_age"][0] or 0)
-    max_age = int(age_bounds["max_age"][0] or 0)
-
-    per_year_lf = (
+def compute_per_year_stats(inspections_lf: pl.LazyFrame, group_cols: list[str]) -> pl.LazyFrame:
+    """Build the lazy statistics for each age year using native Polars."""
+    return (
         inspections_lf.group_by(group_cols + ["age_at_inspection"])
         .agg(
             [
                 pl.col("kenteken").n_unique().alias("vehicle_count"),
                 pl.len().alias("total_inspections"),
-                pl.col("defect_count").sum().cast(pl.Float64).alias("total_defects"),
+                pl.col("defect_count").cast(pl.Float64).sum().alias("total_defects"),
             ]
         )
         .filter(pl.col("vehicle_count") >= THRESHOLD_AGE_BRACKET)
@@ -55,25 +41,44 @@ def compute_per_year_stats(
         .sort(group_cols + ["age_at_inspection"])
     )
 
-    return per_year_lf, min_age, max_age
+
+def _vehicle_year_rate() -> pl.Expr:
+    """Return defects per vehicle year for one inspection, computed once per row."""
+    return (pl.col("defect_count") / pl.col("age_at_inspection").clip(lower_bound=1)).alias(
+        "_vehicle_year_rate"
+    )
+
+
+def _age_bounds_lf(inspections_lf: pl.LazyFrame) -> pl.LazyFrame:
+    """Build the lazy min/max inspection age summary."""
+    return inspections_lf.select(
+        [
+            pl.col("age_at_inspection").min().alias("min_age"),
+            pl.col("age_at_inspection").max().alias("max_age"),
+        ]
+    )
 
 
 def aggregate_brand_stats(
     inspections_lf: pl.LazyFrame,
+    fuel_df: pl.DataFrame,
 ) -> tuple[list[dict], int, int]:
     """Aggregate statistics by brand with per-year stats using native Polars.
 
+    fuel_df holds one fuel_breakdown struct per merk (see build_fuel_breakdown).
+
     Returns:
         Tuple of (brand_stats list, min_age, max_age)
     """
     # Main aggregation
     brand_lf = (
-        inspections_lf.group_by(["merk", "vehicle_type_group", "primary_fuel"])
+        inspections_lf.with_columns(_vehicle_year_rate())
+        .group_by(["merk", "vehicle_type_group", "primary_fuel"])
         .agg(
             [
                 pl.col("kenteken").n_unique().alias("vehicle_count"),
                 pl.len().alias("total_inspections"),
-                pl.col("defect_count").sum().cast(pl.Float64).alias("total_defects"),
+                pl.col("defect_count").cast(pl.Float64).sum().alias("total_defects"),
                 # Inspections with a non-zero defect count (frontend aggregation
                 # numerator for the per-brand defect-found rate)
                 (pl.col("defect_count") > 0).sum().alias("inspections_with_defects"),
@@ -82,25 +87,24 @@ def aggregate_brand_stats(
                 .fill_nan(None)
                 .round(4)
                 .alias("std_defects_per_inspection"),
-                pl.col("age_at_inspection").mean().round(2).alias("avg_age_years"),
                 pl.col("age_at_inspection").sum().cast(pl.Float64).alias("total_vehicle_years"),
                 # Std dev of defects per vehicle year (defect_count / age)
-                (pl.col("defect_count") / pl.col("age_at_inspection").clip(lower_bound=1))
+                pl.col("_vehicle_year_rate")
                 .std()
                 .fill_nan(None)
                 .round(4)
                 .alias("std_defects_per_vehicle_year"),
                 # Sum and SumSq for frontend aggregation
-                (pl.col("defect_count") / pl.col("age_at_inspection").clip(lower_bound=1))
+                pl.col("_vehicle_year_rate")
                 .sum()
                 .cast(pl.Float64)
                 .alias("sum_defects_per_vehicle_year_rates"),
-                ((pl.col("defect_count") / pl.col("age_at_inspection").clip(lower_bound=1)) ** 2)
+                (pl.col("_vehicle_year_rate") ** 2)
                 .sum()
                 .cast(pl.Float64)
                 .alias("sum_sq_defects_per_vehicle_year_rates"),
                 # Sum Sq for defects per inspection (frontend aggregation)
-                pl.col("defect_count").pow(2).sum().cast(pl.Float64).alias("sum_sq_defect_counts"),
+                pl.col("defect_count").cast(pl.Float64).pow(2).sum().alias("sum_sq_defect_counts"),
                 # Sum Catalog Price (frontend aggregation)
                 pl.col("catalogusprijs").sum().cast(pl.Float64).alias("sum_catalog_price"),
                 # Count records with price (frontend aggregation denominator)
@@ -122,19 +126,20 @@ def aggregate_brand_stats(
                 .pipe(lambda expr: pl.when(expr.is_infinite()).then(0.0).otherwise(expr))
                 .round(6)
                 .alias("defects_per_vehicle_year"),
+                (pl.col("total_vehicle_years") / pl.col("total_inspections"))
+                .round(2)
+                .alias("avg_age_years"),
                 pl.col("total_vehicle_years").round(4),
             ]
         )
         .sort("defects_per_vehicle_year")
     )
 
-    # Compute per-year stats using Polars group_by
-    per_year_lf, min_age, max_age = compute_per_year_stats(
-        inspections_lf, ["merk", "vehicle_type_group", "primary_fuel"]
-    )
-
     group_cols = ["merk", "vehicle_type_group", "primary_fuel"]
 
+    # Compute per-year stats using Polars group_by
+    per_year_lf = compute_per_year_stats(inspections_lf, group_cols)
+
     per_year_lists = per_year_lf.group_by(group_cols).agg(
         pl.col("age_at_inspection").cast(pl.String).alias("_keys"),
         pl.struct(
@@ -144,12 +149,17 @@ def aggregate_brand_stats(
             "avg_defects_per_inspection",
         ).alias("_values"),
     )
-    brand_df = brand_lf.collect(engine="streaming")
-    per_year_df = per_year_lists.collect(engine="streaming")
+    # One collect so the shared inspection scan is planned and read together
+    brand_df, per_year_df, age_bounds = pl.collect_all(
+        [brand_lf, per_year_lists, _age_bounds_lf(inspections_lf)], engine="streaming"
+    )
+    min_age = int(age_bounds["min_age"][0] or 0)
+    max_age = int(age_bounds["max_age"][0] or 0)
     if len(per_year_df) > 0:
         brand_df = brand_df.join(per_year_df, on=group_cols, how="left")
     else:
         brand_df = brand_df.with_columns(pl.lit(None).alias("_keys"), pl.lit(None).alias("_values"))
+    brand_df = fuel_breakdown_attach(brand_df, fuel_df, ["merk"])
 
     # Convert main stats to list of dicts
     result = brand_df.to_dicts()
@@ -168,44 +178,47 @@ def aggregate_brand_stats(
 
 def aggregate_model_stats(
     inspections_lf: pl.LazyFrame,
+    fuel_df: pl.DataFrame,
 ) -> tuple[list[dict], int, int]:
     """Aggregate statistics by brand + model with per-year stats using native Polars.
 
+    fuel_df holds one fuel_breakdown struct per merk + handelsbenaming.
+
     Returns:
         Tuple of (model_stats list, min_age, max_age)
     """
     # Main aggregation
     model_lf = (
-        inspections_lf.group_by(["merk", "handelsbenaming", "vehicle_type_group", "primary_fuel"])
+        inspections_lf.with_columns(_vehicle_year_rate())
+        .group_by(["merk", "handelsbenaming", "vehicle_type_group", "primary_fuel"])
         .agg(
             [
                 pl.col("kenteken").n_unique().alias("vehicle_count"),
                 pl.len().alias("total_inspections"),
-                pl.col("defect_count").sum().cast(pl.Float64).alias("total_defects"),
+                pl.col("defect_count").cast(pl.Float64).sum().alias("total_defects"),
                 pl.col("defect_count")
                 .std()
                 .fill_nan(None)
                 .round(4)
                 .alias("std_defects_per_inspection"),
-                pl.col("age_at_inspection").mean().round(2).alias("avg_age_years"),
                 pl.col("age_at_inspection").sum().cast(pl.Float64).alias("total_vehicle_years"),
                 # Std dev of defects per vehicle year (defect_count / age)
-                (pl.col("defect_count") / pl.col("age_at_inspection").clip(lower_bound=1))
+                pl.col("_vehicle_year_rate")
                 .std()
                 .fill_nan(None)
                 .round(4)
                 .alias("std_defects_per_vehicle_year"),
                 # Sum and SumSq for frontend aggregation
-                (pl.col("defect_count") / pl.col("age_at_inspection").clip(lower_bound=1))
+                pl.col("_vehicle_year_rate")
                 .sum()
                 .cast(pl.Float64)
                 .alias("sum_defects_per_vehicle_year_rates"),
-                ((pl.col("defect_count") / pl.col("age_at_inspection").clip(lower_bound=1)) ** 2)
+                (pl.col("_vehicle_year_rate") ** 2)
                 .sum()
                 .cast(pl.Float64)
                 .alias("sum_sq_defects_per_vehicle_year_rates"),
                 # Sum Sq for defects per inspection (frontend aggregation)
-                pl.col("defect_count").pow(2).sum().cast(pl.Float64).alias("sum_sq_defect_counts"),
+                pl.col("defect_count").cast(pl.Float64).pow(2).sum().alias("sum_sq_defect_counts"),
                 # Sum Catalog Price (frontend aggregation)
                 pl.col("catalogusprijs").sum().cast(pl.Float64).alias("sum_catalog_price"),
                 # Count records with price (frontend aggregation denominator)
@@ -233,20 +246,20 @@ def aggregate_model_stats(
                 .pipe(lambda expr: pl.when(expr.is_infinite()).then(0.0).otherwise(expr))
                 .round(6)
                 .alias("defects_per_vehicle_year"),
+                (pl.col("total_vehicle_years") / pl.col("total_inspections"))
+                .round(2)
+                .alias("avg_age_years"),
                 pl.col("total_vehicle_years").round(4),
             ]
         )
         .sort("defects_per_vehicle_year")
     )
 
-    # Compute per-year stats using Polars group_by
-    per_year_lf, min_age, max_age = compute_per_year_stats(
-        inspections_lf,
-        ["merk", "handelsbenaming", "vehicle_type_group", "primary_fuel"],
-    )
-
     group_cols = ["merk", "handelsbenaming", "vehicle_type_group", "primary_fuel"]
 
+    # Compute per-year stats using Polars group_by
+    per_year_lf = compute_per_year_stats(inspections_lf, group_cols)
+
     per_year_lists = per_year_lf.group_by(group_cols).agg(
         pl.col("age_at_inspection").cast(pl.String).alias("_keys"),
         pl.struct(
@@ -256,12 +269,17 @@ def aggregate_model_stats(
             "avg_defects_per_inspection",
         ).alias("_values"),
     )
-    model_df = model_lf.collect(engine="streaming")
-    per_year_df = per_year_lists.collect(engine="streaming")
+    # One collect so the shared inspection scan is planned and read together
+    model_df, per_year_df, age_bounds = pl.collect_all(
+        [model_lf, per_year_lists, _age_bounds_lf(inspections_lf)], engine="streaming"
+    )
+    min_age = int(age_bounds["min_age"][0] or 0)
+    max_age = int(age_bounds["max_age"][0] or 0)
     if len(per_year_df) > 0:
         model_df = model_df.join(per_year_df, on=group_cols, how="left")
     else:
         model_df = model_df.with_columns(pl.lit(None).alias("_keys"), pl.lit(None).alias("_values"))
+    model_df = fuel_breakdown_attach(model_df, fuel_df, ["merk", "handelsbenaming"])
 
     # Convert main stats to list of dicts
     result = model_df.to_dicts()
@@ -322,7 +340,7 @@ def _aggregate_stats_for_ranking(stats_list: list[dict], group_keys: list[str])
     return result
 
 
-def generate_rankings(brand_stats: list[dict], model_stats: list[dict]) -> dict:
+def generate_rankings(brand_stats: list[dict], model_stats: list[dict], generated_at: str) -> dict:
     """Generate top/bottom rankings for brands and models."""
 
     def format_ranking(
@@ -331,12 +349,12 @@ def generate_rankings(brand_stats: list[dict], model_stats: list[dict]) -> dict:
         # Filter by ranking threshold
         candidates = [item for item in items if item.get("vehicle_count", 0) >= threshold]
 
-        # Sort by defects_per_vehicle_year
-        sorted_items = sorted(
-            candidates,
-            key=lambda x: x.get("defects_per_vehicle_year") or float("inf"),
-            reverse=reverse,
-        )[:limit]
+        # Partial selection by defects_per_vehicle_year (same result as a full
+        # sort sliced to limit, including tie order)
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        sorted_items = select(
+            limit, candidates, key=lambda x: x.get("defects_per_vehicle_year") or float("inf")
+        )
 
         result = []
         for rank, item in enumerate(sorted_items, 1):
@@ -383,5 +401,5 @@ def generate_rankings(brand_stats: list[dict], model_stats: list[dict]) -> dict:
         "least_reliable_brands": least_reliable_brands,
         "most_reliable_models": most_reliable_models,
         "least_reliable_models": least_reliable_models,
-        "generated_at": datetime.now().isoformat(),
+        "generated_at": generated_at,
     }
@@ -9,10 +9,13 @@ from pathlib import Path
 
 import psutil
 
+# Reused handle for the current process; memory_mb() is called at every phase
+_PROCESS = psutil.Process()
+
 
 def memory_mb() -> float:
     """Return the current process resident memory in MB."""
-    return psutil.Process().memory_info().rss / (1024 * 1024)
+    return _PROCESS.memory_info().rss / (1024 * 1024)
 
 
 def path_size_mb(path: Path) -> float: